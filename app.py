@@ -1,176 +1,211 @@
 
 # app.py (All-in-One Flask Server and Webpage with wide calibration)
-from flask import Flask, jsonify, request, Response
+from gevent import monkey
+monkey.patch_all()  # must run before anything else imports socket/threading
+
+from gevent.pywsgi import WSGIServer
+from gevent.threadpool import ThreadPoolExecutor
+from flask import Flask, jsonify, request, Response, send_from_directory
 from flask_cors import CORS
-from gpiozero import DigitalInputDevice
+from gpiozero import Device, DigitalInputDevice
 from w1thermsensor import W1ThermSensor
-import logging
+import atexit
+import gzip
+import json
+import orjson
+import os
+import queue
+import threading
+import time
 
 # --- Configuration ---
 SOIL_SENSOR_PIN = 17
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
 app = Flask(__name__)
 CORS(app)
 state = {'calibration_offset': 0.0}
+# Kept next to app.py (not /tmp) so the offset survives a reboot
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+# Bursts of /calibrate POSTs are written to disk once they go quiet for this long
+SAVE_DEBOUNCE = 0.5
+_save_timer = None
+# The write and fsync run on their own native thread so a slow SD card doesn't
+# stall the hub; one worker keeps saves in order
+_save_executor = ThreadPoolExecutor(max_workers=1)
+# Latest raw readings: temp from the background poller, is_wet from soil pin edges
+POLL_INTERVAL = 1.0
+# A temperature older than this means the poller has stopped, so it isn't reported
+STALE_AFTER = 5 * POLL_INTERVAL
+_latest = {'temp': None, 'is_wet': None, 'ts': 0.0}
+_latest_lock = threading.Lock()
+# gevent's executor always uses native threads, so a blocking sysfs read
+# doesn't stall the hub the way it would inside a greenlet
+executor = ThreadPoolExecutor(max_workers=1)
+# Server-Sent Events: one queue per connected /events client
+PUSH_THRESHOLD = 0.2
+KEEPALIVE_INTERVAL = 15
+_subscribers = []
+_published = {'temp': None, 'is_wet': None}
+
+# --- Webpage ---
+# The page lives in static/index.html; a gzipped copy is rebuilt beside it on
+# every start (mtimes aren't trusted, deploys often preserve them)
+INDEX_HTML = os.path.join(app.static_folder, 'index.html')
+INDEX_HTML_GZ = INDEX_HTML + '.gz'
+_serve_gzip = True
+try:
+    with open(INDEX_HTML, 'rb') as src, gzip.open(INDEX_HTML_GZ + '.tmp', 'wb', compresslevel=9) as dst:
+        dst.write(src.read())
+    os.replace(INDEX_HTML_GZ + '.tmp', INDEX_HTML_GZ)
+except OSError as e:
+    print(f"⚠️ Could not write {INDEX_HTML_GZ}, serving the page uncompressed: {e}")
+    _serve_gzip = False
+
+# --- Calibration Persistence ---
+def load_calibration():
+    try:
+        with open(CALIBRATION_FILE) as f:
+            state['calibration_offset'] = max(-10.0, min(10.0, float(json.load(f)['calibration_offset'])))
+        print(f"✅ Loaded calibration offset: {state['calibration_offset']}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Could not load calibration from {CALIBRATION_FILE}: {e}")
 
-# --- HTML & JavaScript for the Webpage ---
-HTML_DOCUMENT = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Plant Monitor</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        body { font-family: 'Inter', sans-serif; }
-        #tempFill { transition: width 0.5s ease-in-out; }
-    </style>
-</head>
-<body class="bg-gray-100 flex items-center justify-center min-h-screen">
-    <div class="w-full max-w-md bg-white rounded-2xl shadow-lg p-6 md:p-8 space-y-6">
-        <h1 class="text-2xl font-bold text-gray-800 text-center">Plant Health Monitor</h1>
-        <div id="status" class="text-center font-semibold text-yellow-600">Fetching data...</div>
-        <!-- Temperature Section -->
-        <div class="space-y-3">
-            <div class="flex justify-between items-baseline">
-                <label class="text-lg font-semibold text-gray-700">Temperature</label>
-                <span id="tempValue" class="text-xl font-bold text-indigo-600">--.-°C</span>
-            </div>
-            <div class="w-full bg-gray-200 rounded-full h-6">
-                <div id="tempFill" class="bg-gradient-to-r from-blue-500 to-red-500 h-full rounded-full w-0"></div>
-            </div>
-        </div>
-        <!-- Soil Moisture Section -->
-        <div class="space-y-3">
-            <label class="text-lg font-semibold text-gray-700">Soil Moisture</label>
-            <div id="moistureBox" class="flex items-center p-4 rounded-lg border-2">
-                <span id="moistureStatus" class="text-xl font-bold text-gray-500">Waiting...</span>
-            </div>
-        </div>
-        <!-- Calibration Section -->
-        <div class="space-y-3 pt-2">
-            <div class="flex justify-between items-baseline">
-                <label for="calSlider" class="text-lg font-semibold text-gray-700">Calibration</label>
-                <span id="calValue" class="text-xl font-bold text-gray-600">0.0°C</span>
-            </div>
-            <!-- *** CHANGE 1: Updated slider min and max values *** -->
-            <input id="calSlider" type="range" min="-10.0" max="10.0" step="0.1" value="0.0" class="w-full h-2 bg-gray-200 rounded-lg appearance-none cursor-pointer">
-            <button id="resetButton" class="w-full mt-2 px-4 py-2 bg-indigo-600 text-white font-semibold rounded-lg hover:bg-indigo-700">Reset</button>
-        </div>
-    </div>
-    <script>
-        const PI_IP_ADDRESS = window.location.hostname || '10.15.138.87';
-        const PI_PORT = 5000;
-        const API_BASE_URL = `http://${PI_IP_ADDRESS}:${PI_PORT}`;
-
-        async function fetchSensorData() {
-            try {
-                const response = await fetch(`${API_BASE_URL}/data`);
-                const data = await response.json();
-                updateUI(data);
-                document.getElementById('status').textContent = 'Connected';
-                document.getElementById('status').className = 'text-center font-semibold text-green-600';
-            } catch (error) {
-                document.getElementById('status').textContent = 'Connection Error';
-                document.getElementById('status').className = 'text-center font-semibold text-red-500';
-            }
-        }
-
-        function updateUI(data) {
-            const tempValue = document.getElementById('tempValue');
-            const tempFill = document.getElementById('tempFill');
-            const moistureBox = document.getElementById('moistureBox');
-            const moistureStatus = document.getElementById('moistureStatus');
-            const calValue = document.getElementById('calValue');
-            const calSlider = document.getElementById('calSlider');
-            
-            if (data.temperature !== null) {
-                tempValue.textContent = `${data.temperature.toFixed(1)}°C`;
-                const percentage = ((data.temperature - -10) / (80 - -10)) * 100;
-                tempFill.style.width = `${Math.max(0, Math.min(100, percentage))}%`;
-            }
-            
-            moistureBox.classList.remove('border-green-500', 'bg-green-50', 'border-red-500', 'bg-red-50');
-            if (data.is_wet) {
-                moistureStatus.textContent = 'Wet';
-                moistureStatus.className = 'text-xl font-bold text-green-600';
-                moistureBox.classList.add('border-green-500', 'bg-green-50');
-            } else {
-                moistureStatus.textContent = 'Dry';
-                moistureStatus.className = 'text-xl font-bold text-red-600';
-                moistureBox.classList.add('border-red-500', 'bg-red-50');
-            }
-            
-            calValue.textContent = `${data.calibration_offset.toFixed(1)}°C`;
-            calSlider.value = data.calibration_offset;
-        }
-        
-        async function sendCalibrationUpdate(offset) {
-            console.log(`Sending POST calibration update: ${offset}`);
-            try {
-                await fetch(`${API_BASE_URL}/calibrate`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ offset: offset }),
-                });
-            } catch (error) {
-                console.error('Calibration POST Error:', error);
-            }
-        }
-
-        document.addEventListener('DOMContentLoaded', () => {
-            const calSlider = document.getElementById('calSlider');
-            const calValue = document.getElementById('calValue');
-            const resetButton = document.getElementById('resetButton');
-
-            calSlider.addEventListener('input', () => {
-                 calValue.textContent = `${parseFloat(calSlider.value).toFixed(1)}°C`;
-            });
-            calSlider.addEventListener('change', () => sendCalibrationUpdate(calSlider.value));
-            resetButton.addEventListener('click', () => {
-                calSlider.value = 0.0;
-                sendCalibrationUpdate(0.0);
-            });
-            
-            setInterval(fetchSensorData, 2000);
-            fetchSensorData();
-        });
-    </script>
-</body>
-</html>
-"""
+def save_calibration():
+    # Write a temp file and swap it in, so a power cut never leaves a half-written file
+    tmp_file = CALIBRATION_FILE + '.tmp'
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, CALIBRATION_FILE)
+    except OSError as e:
+        print(f"⚠️ Could not save calibration to {CALIBRATION_FILE}: {e}")
+
+def schedule_save():
+    global _save_timer
+    if _save_timer is not None:
+        _save_timer.cancel()
+    _save_timer = threading.Timer(SAVE_DEBOUNCE, _save_executor.submit, args=(save_calibration,))
+    _save_timer.daemon = True
+    _save_timer.start()
+
+@atexit.register
+def flush_pending_save():
+    # The debounce timer is a daemon, so write any offset it was still holding back
+    pending = _save_timer is not None and not _save_timer.finished.is_set()
+    if pending:
+        _save_timer.cancel()
+    _save_executor.shutdown(wait=True)  # let a save already in progress finish first
+    if pending:
+        save_calibration()
+
+load_calibration()
 
 # --- Sensor Initialization ---
+try:
+    # pigpiod watches the pins itself, so edges and debouncing cost no syscalls here.
+    # Imported here because the pigpio package isn't available on every Pi (e.g. Pi 5)
+    from gpiozero.pins.pigpio import PiGPIOFactory
+    Device.pin_factory = PiGPIOFactory()
+except Exception as e:  # ImportError or pigpiod not running
+    print(f"⚠️ pigpiod not available, using the default pin factory: {e}")
 try:
     temp_sensor = W1ThermSensor()
-    soil_sensor = DigitalInputDevice(SOIL_SENSOR_PIN)
+    soil_sensor = DigitalInputDevice(SOIL_SENSOR_PIN, bounce_time=0.05)
     print("✅ Sensors initialized successfully.")
 except Exception as e:
     print(f"❌ FATAL: Could not initialize sensors: {e}")
     temp_sensor = None
     soil_sensor = None
 
-# --- API Routes ---
-@app.route('/data')
-def get_sensor_data():
+# --- Background Sensor Poller ---
+def read_temp():
+    try: return temp_sensor.get_temperature()
+    except: return None
+
+def read_soil():
+    try: return not soil_sensor.is_active
+    except: return None
+
+def set_is_wet(is_wet):
+    with _latest_lock:
+        _latest['is_wet'] = is_wet
+
+def reading_changed(raw_temp, is_wet):
+    last_temp = _published['temp']
+    if is_wet != _published['is_wet'] or (raw_temp is None) != (last_temp is None):
+        return True
+    return raw_temp is not None and abs(raw_temp - last_temp) >= PUSH_THRESHOLD
+
+def poll_loop():
+    while True:
+        raw_temp = executor.submit(read_temp).result()
+        with _latest_lock:
+            _latest['temp'] = raw_temp
+            _latest['ts'] = time.monotonic()
+            is_wet = _latest['is_wet']
+        if reading_changed(raw_temp, is_wet):
+            _published['temp'], _published['is_wet'] = raw_temp, is_wet
+            publish()
+        time.sleep(POLL_INTERVAL)
+
+if temp_sensor and soil_sensor:
+    # Soil state only changes on an edge, so let gpiozero tell us instead of
+    # reading the pin every cycle; the poller pushes the flip on its next pass
+    # Callbacks go on before the initial read so no edge is missed in between
+    soil_sensor.when_activated = lambda: set_is_wet(False)
+    soil_sensor.when_deactivated = lambda: set_is_wet(True)
+    set_is_wet(read_soil())
+    threading.Thread(target=poll_loop, daemon=True).start()
+
+# --- Server-Sent Events ---
+def sensor_payload():
     if temp_sensor and soil_sensor:
-        try:
-            raw_temp = temp_sensor.get_temperature()
-            calibrated_temp = raw_temp + state['calibration_offset']
-        except: calibrated_temp = None
-        try:
-            is_wet = not soil_sensor.is_active
-        except: is_wet = None
+        with _latest_lock:
+            raw_temp, is_wet = _latest['temp'], _latest['is_wet']
+            if time.monotonic() - _latest['ts'] > STALE_AFTER:
+                raw_temp = None
+        calibrated_temp = raw_temp + state['calibration_offset'] if raw_temp is not None else None
     else:
         calibrated_temp, is_wet = 20.0, False
-    return jsonify({
+    return {
         "temperature": calibrated_temp,
         "is_wet": is_wet,
         "calibration_offset": state['calibration_offset']
-    })
+    }
+
+def publish():
+    payload = sensor_payload()
+    for q in list(_subscribers):
+        try: q.put_nowait(payload)
+        except queue.Full: pass  # client isn't keeping up; it'll get the next change
+
+# --- API Routes ---
+@app.route('/data')
+def get_sensor_data():
+    return Response(orjson.dumps(sensor_payload()), mimetype='application/json')
+
+@app.route('/events')
+def sensor_events():
+    q = queue.Queue(maxsize=10)
+    _subscribers.append(q)
+
+    def stream():
+        try:
+            yield b"data: " + orjson.dumps(sensor_payload()) + b"\n\n"
+            while True:
+                try:
+                    payload = q.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"data: " + orjson.dumps(payload) + b"\n\n"
+        finally:
+            _subscribers.remove(q)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/calibrate', methods=['POST'])
 def set_calibration():
@@ -180,12 +215,22 @@ def set_calibration():
         print(f"✅ Received calibration request. New offset: {offset}")
         # --- CHANGE 2: Updated server-side limit ---
         state['calibration_offset'] = max(-10.0, min(10.0, float(offset)))
+        schedule_save()
+        publish()
         return jsonify({"status": "success"})
     return jsonify({"status": "error"}), 400
 
 @app.route('/')
 def index():
-    return Response(HTML_DOCUMENT, mimetype='text/html')
+    # send_from_directory handles ETag/304s; gevent's pywsgi has no wsgi.file_wrapper,
+    # so werkzeug streams the file in chunks (no sendfile/zero-copy here)
+    if _serve_gzip and 'gzip' in request.accept_encodings:
+        response = send_from_directory(app.static_folder, 'index.html.gz', mimetype='text/html', max_age=86400)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(app.static_folder, 'index.html', max_age=86400)
+    response.vary.add('Accept-Encoding')
+    return response
 
 # --- Main Execution ---
 if __name__ == "__main__":
@@ -193,4 +238,5 @@ if __name__ == "__main__":
     print("    RUNNING ALL-IN-ONE SERVER    ")
     print("==============================================")
     print(f"🌍 Starting server. Open your browser to http://<YOUR_PI_IP>:5000")
-    app.run(host='0.0.0.0', port=5000)
+    # No per-request access log; errors still go to stderr
+    WSGIServer(('0.0.0.0', 5000), app, log=None).serve_forever()